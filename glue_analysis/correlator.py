@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
-from typing import Any, Self
+import hashlib
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import wraps
+from typing import Any, Self, TypeVar
 
+import numba
 import numpy as np
 import pandas as pd
 import pandera as pa
@@ -30,7 +35,35 @@ _CHECK_DESCRIPTIONS = {
     #
     "Check_Internals_equal": "Internal1 and Internal2 are supposed to form"
     "square matrix, so they must be identical up to reordering.",
+    #
+    "Check_index_unique": "Each combination of index values must occur "
+    "at most once.",
 }
+
+
+def _level_counts(index: pd.MultiIndex, level: str) -> pd.Series:
+    # How often each value occurs, counted in one pass over the integer codes.
+    position = index.names.index(level)
+    level_values = index.levels[position]
+    counts = pd.Series(
+        np.bincount(index.codes[position], minlength=len(level_values)),
+        index=level_values,
+    )
+    return counts[counts > 0].sort_index()
+
+
+def _has_unique_rows(index: pd.MultiIndex) -> bool:
+    # Levels are unique, so comparing the (narrow integer) codes is sufficient.
+    # After sorting, duplicates can only appear as identical neighbours.
+    sorted_codes = np.stack(index.codes)[:, np.lexsort(index.codes)]
+    return not (sorted_codes[:, 1:] == sorted_codes[:, :-1]).all(axis=0).any()
+
+
+_CHECK_INDEX_UNIQUE = pa.Check(
+    lambda df: _has_unique_rows(df.index),
+    description=_CHECK_DESCRIPTIONS["Check_index_unique"],
+    name="Check_index_unique",
+)
 CorrelatorData = pa.DataFrameSchema(
     {
         "Correlation": pa.Column(
@@ -48,14 +81,13 @@ CorrelatorData = pa.DataFrameSchema(
         ],
         strict=True,
         ordered=False,
-        unique=["MC_Time", "Internal1", "Internal2", "Time"],
     ),
     checks=[
+        _CHECK_INDEX_UNIQUE,
         pa.Check(
-            lambda df: (
-                df.index.get_level_values("Internal1").sort_values()
-                == df.index.get_level_values("Internal2").sort_values()
-            ).all(),
+            lambda df: _level_counts(df.index, "Internal1").equals(
+                _level_counts(df.index, "Internal2")
+            ),
             description=_CHECK_DESCRIPTIONS["Check_Internals_equal"],
             name="Check_Internals_equal",
         ),
@@ -74,11 +106,14 @@ VEVData = pa.DataFrameSchema(
         ],
         strict=True,
         ordered=False,
-        unique=["MC_Time", "Internal"],
     ),
+    checks=[_CHECK_INDEX_UNIQUE],
 )
 
 
+T = TypeVar("T")
+
+
 class FrozenError(Exception):
     pass
 
@@ -87,43 +122,197 @@ class DataInconsistencyError(Exception):
     pass
 
 
+_LENGTH_MISMATCH_MESSAGE = "Vevs and correlators are of different length."
+_AXES_MISMATCH_MESSAGE = (
+    "VEVs and correlators have differing MC_Time and Internal axes. "
+    "Are they coming from the same ensemble?"
+)
+
+
+def _sort_key(index: pd.MultiIndex, level: str) -> np.ndarray:
+    # A MultiIndex stores its values as narrow integer codes into the (few)
+    # unique level values. Sorting on those codes is much cheaper than on the
+    # materialised int64 values, provided they follow the order of the values.
+    position = index.names.index(level)
+    codes = index.codes[position]
+    level_values = index.levels[position]
+    if level_values.is_monotonic_increasing:
+        return codes
+    ranks = np.empty(len(level_values), dtype=codes.dtype)
+    ranks[level_values.argsort()] = np.arange(len(level_values), dtype=codes.dtype)
+    return ranks[codes]
+
+
+def _sorted_level_values(
+    index: pd.MultiIndex, level: str, order: np.ndarray
+) -> np.ndarray:
+    position = index.names.index(level)
+    return index.levels[position].to_numpy()[index.codes[position][order]]
+
+
+def _grid_positions(
+    index: pd.MultiIndex, levels: tuple[str, ...], shape: tuple[int, ...]
+) -> np.ndarray | None:
+    # Position of each row in a C-ordered array of the given shape spanned by
+    # the given levels or None if the rows don't fill this grid exactly once.
+    # The position is a single int64 packing the sort keys of all levels, so it
+    # doubles as the destination of each value after sorting.
+    sizes = tuple(len(index.levels[index.names.index(level)]) for level in levels)
+    if sizes != shape or len(index) != np.prod(shape):
+        return None
+    positions = np.zeros(len(index), dtype=np.int64)
+    for level, size in zip(levels, sizes, strict=True):
+        positions = positions * size + _sort_key(index, level)
+    filled = np.zeros(len(index), dtype=bool)
+    filled[positions] = True
+    return positions if filled.all() else None
+
+
+def _to_sorted_array(
+    data: pd.Series, levels: tuple[str, ...], shape: tuple[int, ...]
+) -> np.ndarray:
+    # Returns the values of data in a (read-only) C-ordered array of the given
+    # shape, sorted lexicographically by the given index levels.
+    index = data.index
+    values = data.to_numpy()
+    array = np.empty(shape, dtype=values.dtype, order="C")
+    if (positions := _grid_positions(index, levels, shape)) is not None:
+        # every value has a unique place in the grid, so no sorting is needed
+        array.reshape(-1)[positions] = values
+    else:
+        order = np.lexsort([_sort_key(index, level) for level in reversed(levels)])
+        np.take(values, order, out=array.reshape(-1))
+    # might be shared via the cache, so must not be modified by the caller
+    array.flags.writeable = False
+    return array
+
+
+def _num_unique(index: pd.MultiIndex, level: str) -> int:
+    # Counts the level values actually in use via their (narrow integer) codes
+    # without hashing. Missing values have code -1 and end up in the last slot.
+    position = index.names.index(level)
+    in_use = np.zeros(len(index.levels[position]) + 1, dtype=bool)
+    in_use[index.codes[position]] = True
+    return int(np.count_nonzero(in_use))
+
+
+def _fast_shape_check(
+    corr: DataFrameType[CorrelatorData], vevs: DataFrameType[VEVData]
+) -> None:
+    # Necessary conditions for cross_validate that are cheap to check, so
+    # common mismatches are caught before sorting the full data.
+    max_length = (
+        len(vevs)
+        * _num_unique(corr.index, "Time")
+        * _num_unique(corr.index, "Internal2")
+    )
+    if len(corr) > max_length or len(corr) % max(len(vevs), 1) != 0:
+        raise DataInconsistencyError(_LENGTH_MISMATCH_MESSAGE)
+    if any(
+        _num_unique(corr.index, corr_level) != _num_unique(vevs.index, vevs_level)
+        for corr_level, vevs_level in (
+            ("MC_Time", "MC_Time"),
+            ("Internal1", "Internal"),
+        )
+    ):
+        raise DataInconsistencyError(_AXES_MISMATCH_MESSAGE)
+
+
 def cross_validate(
     corr: DataFrameType[CorrelatorData], vevs: DataFrameType[VEVData]
 ) -> None:
-    vevs_idx = vevs.index.sort_values()
-    try:
-        if not (
-            # It's sufficient to check this one way round (and not with Internal1/2
-            # interchanged) because their consistency is assured from other checks.
-            corr.groupby(by=["Internal2", "Time"]).apply(
-                lambda df: (
-                    df.index.droplevel(["Internal2", "Time"]).sort_values() == vevs_idx
-                ).all()
-            )
-        ).all():
-            message = (
-                "VEVs and correlators have differing MC_Time and Internal axes. "
-                "Are they coming from the same ensemble?"
+    _fast_shape_check(corr, vevs)
+    # It's sufficient to check this one way round (and not with Internal1/2
+    # interchanged) because their consistency is assured from other checks.
+    group_sizes = corr.groupby(level=["Internal2", "Time"]).size()
+    if (group_sizes != len(vevs)).any():
+        raise DataInconsistencyError(_LENGTH_MISMATCH_MESSAGE)
+
+    # Sorted like this, each (Internal2, Time) group occupies one row of the
+    # reshaped arrays and can be compared to the sorted VEV index in one go.
+    corr_order = np.lexsort(
+        [
+            _sort_key(corr.index, level)
+            for level in ("Internal1", "MC_Time", "Time", "Internal2")
+        ]
+    )
+    vevs_order = np.lexsort(
+        [_sort_key(vevs.index, level) for level in ("Internal", "MC_Time")]
+    )
+    shape = (len(group_sizes), len(vevs))
+    if not all(
+        (
+            _sorted_level_values(corr.index, corr_level, corr_order).reshape(shape)
+            == _sorted_level_values(vevs.index, vevs_level, vevs_order)
+        ).all()
+        for corr_level, vevs_level in (
+            ("MC_Time", "MC_Time"),
+            ("Internal1", "Internal"),
+        )
+    ):
+        raise DataInconsistencyError(_AXES_MISMATCH_MESSAGE)
+
+
+# Fingerprints of data that has passed validation (per schema), such that
+# identical data (e.g., frozen repeatedly or read again from the same file)
+# isn't validated again. Bounded to keep memory usage in check; the least
+# recently used entries are evicted first. Each entry holds on to its schema,
+# so the schema's id can't be reused by another one while the entry exists.
+_VALIDATION_CACHE: OrderedDict[tuple[int, bytes], pa.DataFrameSchema] = OrderedDict()
+_VALIDATION_CACHE_SIZE = 64
+
+
+def _fingerprint(data: pd.DataFrame) -> bytes:
+    # The index is part of the data here, so it must be included.
+    fingerprint = hashlib.blake2b(digest_size=16)
+    index_levels = getattr(data.index, "levels", [data.index])
+    fingerprint.update(
+        repr(
+            (
+                tuple(data.columns),
+                tuple(map(str, data.dtypes)),
+                tuple(data.index.names),
+                tuple(str(level.dtype) for level in index_levels),
             )
-            raise DataInconsistencyError(message)
-    except ValueError as ex:
-        message = "Vevs and correlators are of different length."
-        raise DataInconsistencyError(message) from ex
+        ).encode()
+    )
+    fingerprint.update(
+        pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes()
+    )
+    return fingerprint.digest()
 
 
 def validate(schema: pa.DataFrameSchema, data: DataFrameType) -> None:
-    message = (
-        "Non-unique index, "
-        "should be pa.errors.SchemaError but fails due to some incompatibility."
-    )
     try:
+        key = (id(schema), _fingerprint(data))
+    except TypeError:
+        # e.g. unhashable objects in a column, the schema will report on that
         schema.validate(data)
-    except ValueError as ex:
-        if "Columns with duplicate values are not supported" in str(ex):
-            # see https://github.com/unionai-oss/pandera/issues/1328
-            raise ValueError(message) from ex
-        # if this happens, it's an exceptional situation we can't test:
-        raise  # pragma: no cover
+        return
+    if _VALIDATION_CACHE.get(key) is schema:
+        _VALIDATION_CACHE.move_to_end(key)
+        return
+
+    schema.validate(data)
+    _VALIDATION_CACHE[key] = schema
+    if len(_VALIDATION_CACHE) > _VALIDATION_CACHE_SIZE:
+        _VALIDATION_CACHE.popitem(last=False)
+
+
+def _cached_if_frozen(
+    method: Callable[["CorrelatorEnsemble"], T],
+) -> Callable[["CorrelatorEnsemble"], T]:
+    # Frozen data can't change anymore, so derived quantities only need to be
+    # computed once. Unfrozen instances always recompute.
+    @wraps(method)
+    def wrapper(self: "CorrelatorEnsemble") -> T:
+        if not self.frozen:
+            return method(self)
+        if method.__name__ not in self._cache:
+            self._cache[method.__name__] = method(self)
+        return self._cache[method.__name__]
+
+    return wrapper
 
 
 class CorrelatorEnsemble:
@@ -137,9 +326,11 @@ class CorrelatorEnsemble:
     metadata: dict[str, Any]
     ensemble_name: str
     _frozen: bool = False
+    _cache: dict[str, Any]
 
     def __init__(self: Self, filename: str, ensemble_name: str | None = None) -> None:
         self.filename = filename
+        self._cache = {}
         self.ensemble_name = ensemble_name if ensemble_name else "glue_bins"
 
     def _type_validation(self: Self) -> None:
@@ -178,6 +369,7 @@ class CorrelatorEnsemble:
     def correlators(self: Self, value: Any) -> None:  # noqa: ANN401
         if not self.frozen:
             self._correlators = value
+            self._cache.clear()
         else:
             message = (
                 "This instance is frozen. "
@@ -196,6 +388,7 @@ class CorrelatorEnsemble:
     def vevs(self: Self, value: Any) -> None:  # noqa: ANN401
         if not self.frozen:
             self._vevs = value
+            self._cache.clear()
         else:
             message = (
                 "This instance is frozen. "
@@ -208,58 +401,103 @@ class CorrelatorEnsemble:
         return self._frozen
 
     @property
+    @_cached_if_frozen
     def num_timeslices(self: Self) -> int:
-        return len(self._correlators.index.unique("Time"))
+        return _num_unique(self._correlators.index, "Time")
 
     @property
+    @_cached_if_frozen
     def num_internal(self: Self) -> int:
-        return len(self._correlators.index.unique("Internal1"))
+        return _num_unique(self._correlators.index, "Internal1")
 
     @property
+    @_cached_if_frozen
     def num_samples(self: Self) -> int:
-        return len(self._correlators.index.unique("MC_Time"))
+        return _num_unique(self._correlators.index, "MC_Time")
 
+    @_cached_if_frozen
     def get_numpy(self: Self) -> np.array:
-        sorted_correlators = self._correlators.sort_values(
-            by=["MC_Time", "Time", "Internal1", "Internal2"]
-        )
-        return sorted_correlators.Correlation.to_numpy().reshape(
-            self.num_samples, self.num_timeslices, self.num_internal, self.num_internal
+        # MC_Time is sorted fastest, i.e., stored contiguously, such that the
+        # samples of each observable can be read with unit stride.
+        array = _to_sorted_array(
+            self._correlators.Correlation,
+            ("Time", "Internal1", "Internal2", "MC_Time"),
+            (
+                self.num_timeslices,
+                self.num_internal,
+                self.num_internal,
+                self.num_samples,
+            ),
         )
+        return np.moveaxis(array, -1, 0)
 
+    @_cached_if_frozen
     def get_numpy_vevs(self: Self) -> np.array:
-        sorted_vevs = self._vevs.sort_values(by=["MC_Time", "Internal"])
-        return sorted_vevs.Vac_exp.to_numpy().reshape(
-            self.num_samples, self.num_internal
+        array = _to_sorted_array(
+            self._vevs.Vac_exp,
+            ("Internal", "MC_Time"),
+            (self.num_internal, self.num_samples),
         )
+        return np.moveaxis(array, -1, 0)
 
     def get_pyerrors(self: Self, *, subtract: bool = False) -> pe.Corr:
         if subtract and not hasattr(self, "_vevs"):
             message = "Can't subtract vevs that have not been read."
             raise ValueError(message)
 
-        return pe.Corr(
-            to_obs_array(self.get_numpy(), self.ensemble_name)
-            - (
-                np.outer(
-                    *(2 * [to_obs_array(self.get_numpy_vevs(), self.ensemble_name)])
-                )
-                if subtract
-                else 0.0
+        array = self.get_numpy()
+        if subtract:
+            array = _subtract_vevs(array, self.get_numpy_vevs())
+        return pe.Corr(to_obs_array(array, self.ensemble_name))
+
+
+def _subtract_vevs(correlators: np.array, vevs: np.array) -> np.array:
+    # pyerrors propagates errors to linear order, so the fluctuations of the
+    # product of two VEVs are <v_j> dv_i + <v_i> dv_j. Subtracting this
+    # linearised product sample by sample yields the same pe.Obs as
+    # subtracting the outer product of the VEVs as pe.Obs from the correlators
+    # but without any arithmetic on object arrays of pe.Obs.
+    # The kernel works with MC_Time as the last axis to keep samples contiguous.
+    return np.moveaxis(
+        _subtract_linearised_vev_product(
+            np.moveaxis(correlators, 0, -1),
+            np.moveaxis(vevs, 0, -1),
+            vevs.mean(axis=0),
+        ),
+        -1,
+        0,
+    )
+
+
+@numba.njit(parallel=True, cache=True)
+def _subtract_linearised_vev_product(
+    correlators: np.array, vevs: np.array, mean: np.array
+) -> np.array:
+    num_timeslices, num_internal, _, num_samples = correlators.shape
+    result = np.empty(correlators.shape)
+    for cell in numba.prange(num_timeslices * num_internal**2):
+        t = cell // num_internal**2
+        i = cell // num_internal % num_internal
+        j = cell % num_internal
+        for sample in range(num_samples):
+            result[t, i, j, sample] = correlators[t, i, j, sample] - (
+                vevs[i, sample] * mean[j]
+                + mean[i] * vevs[j, sample]
+                - mean[i] * mean[j]
             )
-        )
+    return result
 
 
 def to_obs_array(array: np.array, ensemble_name: str) -> pe.Obs:
     if array.ndim == 1:
         return pe.Obs([array], [ensemble_name])
 
-    return np.asarray(
-        [
-            to_obs_array(sub_array, ensemble_name)
-            for sub_array in np.moveaxis(array, 1, 0)
-        ]
-    )
+    # one contiguous row of MC samples per observable
+    samples = np.ascontiguousarray(array.reshape(array.shape[0], -1).T)
+    obs_array = np.empty(samples.shape[0], dtype=object)
+    for i, sample in enumerate(samples):
+        obs_array[i] = pe.Obs([sample], [ensemble_name])
+    return obs_array.reshape(array.shape[1:])
 
 
 def _concatenate_without_checks(
@@ -17,7 +17,9 @@ from glue_analysis.correlator import (
     FrozenError,
     VEVData,
     concatenate,
+    cross_validate,
     to_obs_array,
+    validate,
 )
 
 LENGTH_MC_TIME = 5  # needs at least 5 or pe.Corr complains
@@ -108,6 +110,12 @@ def multiple_corr_ensembles(
     return [frozen_corr_ensemble, second_ensemble]
 
 
+def must_not_be_called(*_args: Any, **_kwargs: Any) -> None:  # noqa: ANN401
+    # to be monkeypatched over functions that are supposed to be skipped
+    message = "This should not have been called."
+    raise AssertionError(message)
+
+
 def create_corr_ensemble(
     filename: str, corr_data: CorrelatorData, vev_data: VEVData, *, frozen: bool
 ) -> CorrelatorEnsemble:
@@ -201,6 +209,17 @@ def test_correlator_ensemble_reports_correct_num_samples_with_gaps(
     assert unfrozen_corr_ensemble.num_samples == LENGTH_MC_TIME
 
 
+def test_correlator_ensemble_reports_correct_num_samples_with_unused_levels(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    num_remaining_samples = 2
+    # slicing keeps all values in the index levels even if they're unused now
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.loc(axis=0)[
+        1:num_remaining_samples, ...
+    ]
+    assert unfrozen_corr_ensemble.num_samples == num_remaining_samples
+
+
 def test_correlator_ensemble_returns_correctly_shaped_numpy(
     frozen_corr_ensemble: CorrelatorEnsemble,
 ) -> None:
@@ -231,6 +250,90 @@ def test_correlator_ensemble_returns_sorted_numpy_data(
     assert (unfrozen_corr_ensemble.freeze().get_numpy().ravel() == expected).all()
 
 
+def test_correlator_ensemble_returns_numpy_with_contiguous_samples(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    assert frozen_corr_ensemble.get_numpy()[:, 0, 0, 0].flags["C_CONTIGUOUS"]
+
+
+def test_correlator_ensemble_returns_numpy_vevs_with_contiguous_samples(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    assert frozen_corr_ensemble.get_numpy_vevs()[:, 0].flags["C_CONTIGUOUS"]
+
+
+def test_correlator_ensemble_returns_read_only_numpy(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    with pytest.raises(ValueError, match="read-only"):
+        frozen_corr_ensemble.get_numpy()[0, 0, 0, 0] = 42.0
+
+
+def test_correlator_ensemble_returns_read_only_numpy_vevs(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    with pytest.raises(ValueError, match="read-only"):
+        frozen_corr_ensemble.get_numpy_vevs()[0, 0] = 42.0
+
+
+def test_correlator_ensemble_caches_numpy_when_frozen(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    assert frozen_corr_ensemble.get_numpy() is frozen_corr_ensemble.get_numpy()
+
+
+def test_correlator_ensemble_does_not_cache_numpy_when_unfrozen(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    new_value = 42.0
+    unfrozen_corr_ensemble.get_numpy()
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.assign(
+        Correlation=new_value
+    )
+    assert (unfrozen_corr_ensemble.get_numpy() == new_value).all()
+
+
+def test_correlator_ensemble_returns_sorted_numpy_data_for_other_level_order(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    expected = unfrozen_corr_ensemble.correlators["Correlation"].to_numpy()
+    # This is the order used by the binary reader:
+    unfrozen_corr_ensemble.correlators = (
+        unfrozen_corr_ensemble.correlators.reorder_levels(
+            ["MC_Time", "Internal1", "Internal2", "Time"]
+        ).sort_index()
+    )
+    assert (unfrozen_corr_ensemble.freeze().get_numpy().ravel() == expected).all()
+
+
+def test_correlator_ensemble_returns_sorted_numpy_data_for_unsorted_levels(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    idx = unfrozen_corr_ensemble.correlators.index
+    # The order of the level values is reversed now but that of the codes isn't.
+    unfrozen_corr_ensemble.correlators.index = idx.set_levels(
+        idx.levels[idx.names.index("Time")].map(lambda x: -x), level="Time"
+    )
+    expected = unfrozen_corr_ensemble.correlators.sort_index(
+        level=["MC_Time", "Time", "Internal1", "Internal2"]
+    )["Correlation"].to_numpy()
+    assert (unfrozen_corr_ensemble.get_numpy().ravel() == expected).all()
+
+
+def test_correlator_ensemble_returns_sorted_numpy_data_with_unused_levels(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    # slicing keeps all values in the index levels even if they're unused now
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.loc(axis=0)[
+        2:3, ...
+    ]
+    expected = unfrozen_corr_ensemble.correlators["Correlation"].to_numpy()
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.sample(
+        frac=1
+    )
+    assert (unfrozen_corr_ensemble.get_numpy().ravel() == expected).all()
+
+
 def test_correlator_ensemble_returns_correctly_shaped_numpy_vevs(
     frozen_corr_ensemble: CorrelatorEnsemble,
 ) -> None:
@@ -295,6 +398,44 @@ def test_correlator_ensemble_returned_correlator_has_correct_subtracted_averages
             ).all()
 
 
+def test_correlator_ensemble_returned_correlator_has_correct_subtracted_errors(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    rng = np.random.default_rng(seed=42)
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.assign(
+        Correlation=rng.random(CORRELATOR_DATA_LENGTH)
+    )
+    unfrozen_corr_ensemble.vevs = unfrozen_corr_ensemble.vevs.assign(
+        Vac_exp=rng.random(VEV_DATA_LENGTH)
+    )
+    corr_ensemble = unfrozen_corr_ensemble.freeze()
+    corr = corr_ensemble.get_pyerrors(subtract=True)
+    # reference: perform the subtraction with full pyerrors error propagation
+    vevs = to_obs_array(corr_ensemble.get_numpy_vevs(), "glue_bins")
+    expected = pe.Corr(
+        to_obs_array(corr_ensemble.get_numpy(), "glue_bins") - np.outer(vevs, vevs)
+    )
+    corr.gamma_method()
+    expected.gamma_method()
+    for i in range(LENGTH_INTERNAL):
+        for j in range(LENGTH_INTERNAL):
+            assert np.allclose(
+                corr.item(i, j).plottable()[1:], expected.item(i, j).plottable()[1:]
+            )
+
+
+@pytest.mark.parametrize("subtract", [True, False], ids=["subtract", "no-subtract"])
+def test_correlator_ensemble_performs_no_arithmetic_on_obs(
+    frozen_corr_ensemble: CorrelatorEnsemble,
+    monkeypatch: pytest.MonkeyPatch,
+    *,
+    subtract: bool,
+) -> None:
+    for operator in ("add", "sub", "mul", "radd", "rsub", "rmul"):
+        monkeypatch.setattr(pe.Obs, f"__{operator}__", must_not_be_called)
+    assert isinstance(frozen_corr_ensemble.get_pyerrors(subtract=subtract), pe.Corr)
+
+
 def test_correlator_ensemble_has_configurable_ensemble_name(
     corr_data: CorrelatorData,
 ) -> None:
@@ -462,6 +603,16 @@ def test_correlator_ensemble_freezing_fails_with_wrong_index_datatypes(
         unfrozen_corr_ensemble.freeze()
 
 
+def test_correlator_ensemble_freezing_fails_with_unhashable_datatypes(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    unfrozen_corr_ensemble.correlators["Correlation"] = [
+        [value] for value in unfrozen_corr_ensemble.correlators["Correlation"]
+    ]
+    with pytest.raises(pa.errors.SchemaError):
+        unfrozen_corr_ensemble.freeze()
+
+
 def test_correlator_ensemble_freezing_fails_with_wrong_datatypes_in_vevs(
     unfrozen_corr_ensemble: CorrelatorEnsemble,
 ) -> None:
@@ -495,6 +646,19 @@ def test_correlator_ensemble_freezing_fails_if_internals_differ_in_content(
         unfrozen_corr_ensemble.freeze()
 
 
+def test_correlator_ensemble_freezing_fails_if_internals_differ_in_multiplicity(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    # Internal1 and Internal2 still contain the same values but an off-diagonal
+    # element is missing, so the value 1 occurs once more in Internal2 than in
+    # Internal1 (and vice versa for 2).
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.drop(
+        (1, 1, 1, 2)
+    )
+    with pytest.raises(pa.errors.SchemaError, match="Check_Internals_equal"):
+        unfrozen_corr_ensemble.freeze()
+
+
 def test_correlator_ensemble_fails_if_indexing_rows_are_not_unique(
     unfrozen_corr_ensemble: CorrelatorEnsemble,
 ) -> None:
@@ -503,11 +667,7 @@ def test_correlator_ensemble_fails_if_indexing_rows_are_not_unique(
     # another check is triggered, too.
     idx.iloc[0] = idx.iloc[4]
     unfrozen_corr_ensemble.correlators.index = pd.MultiIndex.from_frame(idx)
-    message = (
-        "Non-unique index, "
-        "should be pa.errors.SchemaError but fails due to some incompatibility."
-    )
-    with pytest.raises(ValueError, match=message):
+    with pytest.raises(pa.errors.SchemaError, match="Check_index_unique"):
         unfrozen_corr_ensemble.freeze()
 
 
@@ -517,11 +677,7 @@ def test_correlator_ensemble_fails_if_indexing_rows_are_not_unique_vevs(
     idx = unfrozen_corr_ensemble.vevs.index.to_frame()
     idx.iloc[0] = idx.iloc[1]
     unfrozen_corr_ensemble.vevs.index = pd.MultiIndex.from_frame(idx)
-    message = (
-        "Non-unique index, "
-        "should be pa.errors.SchemaError but fails due to some incompatibility."
-    )
-    with pytest.raises(ValueError, match=message):
+    with pytest.raises(pa.errors.SchemaError, match="Check_index_unique"):
         unfrozen_corr_ensemble.freeze()
 
 
@@ -555,6 +711,108 @@ def test_correlator_ensemble_fails_if_vevs_and_correlators_with_different_index(
         unfrozen_corr_ensemble.freeze()
 
 
+@pytest.mark.parametrize(
+    ("num_mc_time", "num_internal"),
+    [
+        (LENGTH_MC_TIME - 1, LENGTH_INTERNAL),
+        (LENGTH_MC_TIME, LENGTH_INTERNAL - 1),
+        # same length as the original VEVs but differently shaped:
+        (LENGTH_INTERNAL, LENGTH_MC_TIME),
+    ],
+    ids=["MC_Time", "Internal", "transposed"],
+)
+def test_cross_validate_fails_early_on_mismatching_shapes(
+    corr_data: CorrelatorData,
+    num_mc_time: int,
+    num_internal: int,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    vevs = pd.DataFrame(
+        {"Vac_exp": np.ones(num_mc_time * num_internal)},
+        index=pd.MultiIndex.from_product(
+            [range(1, num_mc_time + 1), range(1, num_internal + 1)],
+            names=["MC_Time", "Internal"],
+        ),
+    )
+
+    monkeypatch.setattr(pd.DataFrame, "groupby", must_not_be_called)
+    with pytest.raises(DataInconsistencyError):
+        cross_validate(corr_data, vevs)
+
+
+def test_correlator_ensemble_cross_validates_scrambled_data(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    unfrozen_corr_ensemble.correlators = unfrozen_corr_ensemble.correlators.sample(
+        frac=1
+    )
+    unfrozen_corr_ensemble.vevs = unfrozen_corr_ensemble.vevs.sample(frac=1)
+    assert unfrozen_corr_ensemble.freeze().frozen
+
+
+def test_correlator_ensemble_fails_if_vevs_and_correlators_differ_in_a_single_entry(
+    unfrozen_corr_ensemble: CorrelatorEnsemble,
+) -> None:
+    idx = unfrozen_corr_ensemble.vevs.index.to_frame()
+    idx.iloc[0, idx.columns.get_loc("MC_Time")] = LENGTH_MC_TIME + 1
+    unfrozen_corr_ensemble.vevs.index = pd.MultiIndex.from_frame(idx)
+    # same length and a valid index, only a single MC_Time doesn't match
+    with pytest.raises(DataInconsistencyError):
+        unfrozen_corr_ensemble.freeze()
+
+
+@pytest.mark.parametrize("copy", [False, True], ids=["same-frame", "deep-copy"])
+def test_correlator_ensemble_does_not_revalidate_unchanged_data(
+    filename: str,
+    corr_data: CorrelatorData,
+    vev_data: VEVData,
+    monkeypatch: pytest.MonkeyPatch,
+    *,
+    copy: bool,
+) -> None:
+    create_corr_ensemble(filename, corr_data, vev_data, frozen=True)
+
+    monkeypatch.setattr(CorrelatorData, "validate", must_not_be_called)
+    monkeypatch.setattr(VEVData, "validate", must_not_be_called)
+    # a copy is different data (even in a different ensemble) with same content
+    assert create_corr_ensemble(
+        "other-filename" if copy else filename,
+        corr_data.copy(deep=True) if copy else corr_data,
+        vev_data.copy(deep=True) if copy else vev_data,
+        frozen=True,
+    ).frozen
+
+
+def test_validate_does_not_mistake_a_new_schema_for_a_freed_one() -> None:
+    data = pd.DataFrame({"a": [1.0, 2.0]})
+    for _ in range(200):
+        # once freed, the id of this schema could be reused by the next one
+        validate(pa.DataFrameSchema({"a": pa.Column(float)}), data)
+        with pytest.raises(pa.errors.SchemaError):
+            validate(pa.DataFrameSchema({"a": pa.Column(float, pa.Check.lt(0))}), data)
+
+
+def test_correlator_ensemble_revalidates_data_with_different_index_dtype(
+    filename: str, corr_data: CorrelatorData, vev_data: VEVData
+) -> None:
+    create_corr_ensemble(filename, corr_data, vev_data, frozen=True)
+    idx = corr_data.index
+    corr_data.index = idx.set_levels(
+        idx.levels[idx.names.index("Time")].astype(np.int32), level="Time"
+    )
+    with pytest.raises(pa.errors.SchemaError):
+        create_corr_ensemble(filename, corr_data, vev_data, frozen=True)
+
+
+def test_correlator_ensemble_revalidates_data_modified_in_place(
+    filename: str, corr_data: CorrelatorData, vev_data: VEVData
+) -> None:
+    create_corr_ensemble(filename, corr_data, vev_data, frozen=True)
+    corr_data["Correlation"] = "str is surely the wrong dtype"
+    with pytest.raises(pa.errors.SchemaError):
+        create_corr_ensemble(filename, corr_data, vev_data, frozen=True)
+
+
 def test_correlator_ensemble_can_freeze_without_validation(
     unfrozen_corr_ensemble: CorrelatorEnsemble,
 ) -> None: